@@ -6,48 +6,182 @@ CGM 數據分析工具
 
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 純檔案輸出，避免載入 GUI 後端（批次 worker 尤其重要）
 import matplotlib.pyplot as plt
 from matplotlib import rcParams
+from matplotlib.collections import LineCollection
 import seaborn as sns
 from datetime import datetime, timedelta
 import sys
 import os
+from pathlib import Path
 from typing import Dict, Tuple, Optional
 import json
 
+# PyArrow 提供多執行緒 C++ CSV 解析與向量化日期解析；未安裝時退回 pandas
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pc = pacsv = None
+
+# Numba 可將 MAGE 的狀態機掃描 JIT 成原生迴圈；未安裝時使用 NumPy 向量化路徑
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# orjson 原生處理 numpy 型別，免去逐值 isinstance 轉換；未安裝時退回 stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 設置中文顯示
 plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
+if njit is not None:
+    @njit(cache=True)
+    def _mage_scan(glucose, sd):
+        """單次掃描血糖序列，回傳所有超過 1 SD 的波段振幅"""
+        out = np.empty(glucose.shape[0], np.float32)
+        count = 0
+        direction = 0  # 0: 未定, 1: 上升, -1: 下降
+        start = 0
+
+        for i in range(1, glucose.shape[0]):
+            diff = glucose[i] - glucose[i - 1]
+            if abs(diff) > sd:
+                if direction == 0:
+                    direction = 1 if diff > 0 else -1
+                    start = i - 1
+                elif (direction == 1 and diff < 0) or (direction == -1 and diff > 0):
+                    amplitude = abs(glucose[i - 1] - glucose[start])
+                    if amplitude > sd:
+                        out[count] = amplitude
+                        count += 1
+                    direction = 1 if diff > 0 else -1
+                    start = i - 1
+
+        return out[:count]
+else:
+    _mage_scan = None
+
 class CGMAnalyzer:
     """CGM 數據分析器"""
 
-    def __init__(self, glucose_file: str, event_file: Optional[str] = None):
+    def __init__(self, glucose_file: str, event_file: Optional[str] = None,
+                 use_cache: bool = True):
         """
         初始化分析器
 
         Args:
             glucose_file: 血糖數據檔案路徑
             event_file: 事件數據檔案路徑（選擇性）
+            use_cache: 是否在 CSV 旁建立 Parquet 快取，重跑時跳過 CSV 解析
         """
+        self.use_cache = use_cache and pa is not None
         self.glucose_df = self._load_glucose_data(glucose_file)
         self.event_df = self._load_event_data(event_file) if event_file else None
         self.metrics = {}
+        self._sorted_glucose = None  # calculate_metrics 重複呼叫時共用的排序快取
+        self._invariant_computed = False  # 與目標範圍無關的指標是否已計算
+
+    def _get_sorted_glucose(self) -> np.ndarray:
+        """取得排序後的血糖陣列（第一次呼叫排序，之後重複使用）"""
+        glucose_values = self.glucose_df['Glucose'].values
+        if (self._sorted_glucose is None or
+                self._sorted_glucose.size != glucose_values.size):
+            self._sorted_glucose = np.sort(glucose_values)
+        return self._sorted_glucose
+
+    @staticmethod
+    def _cache_path(file_path: str) -> Path:
+        """以 mtime 命名的 Parquet 快取路徑（來源檔更新即自然失效）"""
+        return Path(file_path).with_suffix(
+            f'.{os.path.getmtime(file_path):.0f}.parquet')
 
     def _load_glucose_data(self, file_path: str) -> pd.DataFrame:
         """載入血糖數據"""
-        df = pd.read_csv(file_path)
-        df['Timestamp'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
-        df['Glucose'] = pd.to_numeric(df['Sensor Glucose (mg/dL)'], errors='coerce')
+        cache = self._cache_path(file_path) if self.use_cache else None
+        if cache is not None and cache.exists():
+            df = pd.read_parquet(cache)
+            print(f"✓ 載入 {len(df)} 筆血糖數據（Parquet 快取）")
+            return df
+
+        df = self._read_glucose_csv(file_path)
         df = df.dropna(subset=['Glucose'])
         df = df.sort_values('Timestamp')
+
+        # 載入時一次性快取時間欄位（SoA 數值欄），
+        # 避免下游每次繪圖/統計重複呼叫 .dt 配置新陣列
+        ts = df['Timestamp'].values.astype('datetime64[m]')
+        df['Hour'] = (ts.astype('datetime64[h]').astype('int64') % 24).astype(np.uint8)
+        df['Minute'] = (ts.astype('int64') % 60).astype(np.uint8)
+        df['TimeOfDay'] = (df['Hour'].to_numpy(np.float32) +
+                           df['Minute'].to_numpy(np.float32) / 60)
+        df['DateOrdinal'] = ts.astype('datetime64[D]').astype('int32')
+
+        if cache is not None:
+            try:
+                df.to_parquet(cache, compression='zstd', index=False)
+            except Exception:
+                pass  # 快取寫入失敗不影響分析
+
         print(f"✓ 載入 {len(df)} 筆血糖數據")
         return df
 
+    @staticmethod
+    def _read_glucose_csv(file_path: str) -> pd.DataFrame:
+        """讀取血糖 CSV 並建立 Timestamp / Glucose 欄位"""
+        if pacsv is not None:
+            try:
+                tbl = pacsv.read_csv(file_path, convert_options=pacsv.ConvertOptions(
+                    column_types={'Date': pa.string(), 'Time': pa.string()}))
+                joined = pc.binary_join_element_wise(tbl['Date'], tbl['Time'], ' ')
+                # 逐格式嘗試，支援含秒與不含秒的時間欄位
+                ts = pc.coalesce(
+                    pc.strptime(joined, format='%Y-%m-%d %H:%M:%S',
+                                unit='s', error_is_null=True),
+                    pc.strptime(joined, format='%Y-%m-%d %H:%M',
+                                unit='s', error_is_null=True))
+                # error_is_null 不會丟例外：strptime 多出來的 null 代表
+                # 日期不是上述格式（如 MM/DD/YYYY），改走 pandas 彈性解析
+                if ts.null_count > joined.null_count:
+                    raise ValueError('日期格式不符，改用 pandas 解析')
+                df = tbl.append_column('Timestamp', ts).to_pandas()
+                df['Glucose'] = pd.to_numeric(df['Sensor Glucose (mg/dL)'],
+                                              errors='coerce').astype(np.float32)
+                return df
+            except Exception:
+                pass  # 格式不符時退回 pandas 解析
+
+        df = pd.read_csv(file_path)
+        df['Timestamp'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+        df['Glucose'] = pd.to_numeric(df['Sensor Glucose (mg/dL)'],
+                                      errors='coerce').astype(np.float32)
+        return df
+
     def _load_event_data(self, file_path: str) -> pd.DataFrame:
         """載入事件數據"""
+        cache = self._cache_path(file_path) if self.use_cache else None
+        if cache is not None and cache.exists():
+            df = pd.read_parquet(cache)
+            print(f"✓ 載入 {len(df)} 筆事件數據（Parquet 快取）")
+            return df
+
         df = pd.read_csv(file_path)
         df['Timestamp'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+
+        if cache is not None:
+            try:
+                df.to_parquet(cache, compression='zstd', index=False)
+            except Exception:
+                pass
+
         print(f"✓ 載入 {len(df)} 筆事件數據")
         return df
 
@@ -61,29 +195,44 @@ class CGMAnalyzer:
         Returns:
             包含所有指標的字典
         """
-        low_limit, high_limit = target_range
-        glucose_values = self.glucose_df['Glucose'].values
+        # 與目標範圍無關的部分只算一次；換範圍重呼叫時只需重算 TIR/TAR/TBR
+        self._compute_range_invariant()
+        self._compute_range_dependent(target_range)
+
+        return self.metrics
 
-        # 基本統計
-        self.metrics['Mean Glucose'] = np.mean(glucose_values)
-        self.metrics['Median Glucose'] = np.median(glucose_values)
-        self.metrics['SD'] = np.std(glucose_values)
-        self.metrics['CV'] = (self.metrics['SD'] / self.metrics['Mean Glucose']) * 100
+    def _compute_range_invariant(self):
+        """計算與目標範圍無關的指標（首次呼叫後快取）"""
+        if self._invariant_computed:
+            return
 
-        # Time in Range 計算
+        glucose_values = self.glucose_df['Glucose'].values
+
+        # 基本統計：mean/std 以單次掃描的 sum 與平方和求得，
+        # median 直接取自 TIR 計算共用的排序陣列
         total_readings = len(glucose_values)
-        self.metrics['TIR'] = (np.sum((glucose_values >= low_limit) &
-                                      (glucose_values <= high_limit)) / total_readings) * 100
-        self.metrics['TAR'] = (np.sum(glucose_values > high_limit) / total_readings) * 100
-        self.metrics['TBR'] = (np.sum(glucose_values < low_limit) / total_readings) * 100
-
-        # 詳細範圍
-        self.metrics['Very Low (<54)'] = (np.sum(glucose_values < 54) / total_readings) * 100
-        self.metrics['Low (54-69)'] = (np.sum((glucose_values >= 54) &
-                                              (glucose_values < 70)) / total_readings) * 100
-        self.metrics['High (181-250)'] = (np.sum((glucose_values > 180) &
-                                                 (glucose_values <= 250)) / total_readings) * 100
-        self.metrics['Very High (>250)'] = (np.sum(glucose_values > 250) / total_readings) * 100
+        sorted_glucose = self._get_sorted_glucose()
+        # float32 資料用 float64 累加器求和，避免精度流失
+        total = glucose_values.sum(dtype=np.float64)
+        total_sq = float(np.einsum('i,i->', glucose_values, glucose_values,
+                                   dtype=np.float64))
+        mean = total / total_readings
+        sd = np.sqrt(max(total_sq / total_readings - mean * mean, 0.0))
+
+        self.metrics['Mean Glucose'] = mean
+        self.metrics['Median Glucose'] = (sorted_glucose[(total_readings - 1) // 2] +
+                                          sorted_glucose[total_readings // 2]) / 2
+        self.metrics['SD'] = sd
+        self.metrics['CV'] = (sd / mean) * 100
+
+        # 詳細範圍（固定 54/70/180/250 閾值）
+        below_54, below_70 = np.searchsorted(sorted_glucose, [54, 70], side='left')
+        upto_180, upto_250 = np.searchsorted(sorted_glucose, [180, 250], side='right')
+
+        self.metrics['Very Low (<54)'] = (below_54 / total_readings) * 100
+        self.metrics['Low (54-69)'] = ((below_70 - below_54) / total_readings) * 100
+        self.metrics['High (181-250)'] = ((upto_250 - upto_180) / total_readings) * 100
+        self.metrics['Very High (>250)'] = ((total_readings - upto_250) / total_readings) * 100
 
         # GMI (Glucose Management Indicator)
         self.metrics['GMI'] = (3.31 + 0.02392 * self.metrics['Mean Glucose'])
@@ -92,12 +241,25 @@ class CGMAnalyzer:
         self.metrics['GRI'] = self._calculate_gri()
 
         # MAGE (Mean Amplitude of Glycemic Excursions)
-        self.metrics['MAGE'] = self._calculate_mage()
+        self.metrics['MAGE'] = self._calculate_mage(sd)
 
         # 每日統計
         self._calculate_daily_patterns()
 
-        return self.metrics
+        self._invariant_computed = True
+
+    def _compute_range_dependent(self, target_range: Tuple[int, int]):
+        """由排序陣列導出隨目標範圍變動的 TIR/TAR/TBR"""
+        low_limit, high_limit = target_range
+        sorted_glucose = self._get_sorted_glucose()
+        total_readings = sorted_glucose.size
+
+        below_low = np.searchsorted(sorted_glucose, low_limit, side='left')
+        upto_high = np.searchsorted(sorted_glucose, high_limit, side='right')
+
+        self.metrics['TIR'] = ((upto_high - below_low) / total_readings) * 100
+        self.metrics['TAR'] = ((total_readings - upto_high) / total_readings) * 100
+        self.metrics['TBR'] = (below_low / total_readings) * 100
 
     def _calculate_gri(self) -> float:
         """計算 GRI 風險指數"""
@@ -109,51 +271,50 @@ class CGMAnalyzer:
         gri = (3.0 * v_low) + (2.4 * low) + (1.6 * v_high) + (0.8 * high)
         return gri
 
-    def _calculate_mage(self) -> float:
+    def _calculate_mage(self, sd: float) -> float:
         """計算 MAGE（平均血糖波動幅度）"""
         glucose = self.glucose_df['Glucose'].values
-        sd = np.std(glucose)
 
-        # 找出所有超過1個標準差的波動
-        excursions = []
-        direction = 0  # 0: 未定, 1: 上升, -1: 下降
+        # 優先走 JIT 單次掃描：無中間陣列配置，分支預測友善
+        if _mage_scan is not None:
+            excursions = _mage_scan(glucose, np.float32(sd))
+            return float(excursions.mean()) if excursions.size else 0.0
 
-        for i in range(1, len(glucose)):
-            diff = glucose[i] - glucose[i-1]
+        # 找出所有超過1個標準差的波動（向量化：以顯著變化的方向轉折切分波段）
+        diffs = np.diff(glucose)
+        idx = np.flatnonzero(np.abs(diffs) > sd)
+        if idx.size < 2:
+            return 0.0
 
-            if abs(diff) > sd:
-                if direction == 0:
-                    direction = 1 if diff > 0 else -1
-                    excursion_start = i-1
-                elif (direction == 1 and diff < 0) or (direction == -1 and diff > 0):
-                    # 方向改變
-                    excursion_amplitude = abs(glucose[i-1] - glucose[excursion_start])
-                    if excursion_amplitude > sd:
-                        excursions.append(excursion_amplitude)
-                    direction = 1 if diff > 0 else -1
-                    excursion_start = i-1
+        signs = np.sign(diffs[idx])
+        # 方向改變處為新波段起點（第一個顯著變化必為起點）
+        turns = np.concatenate(([True], np.diff(signs) != 0))
+        seg_starts = idx[turns]
+
+        # 每次方向改變時，波段振幅 = 轉折點與前一起點的血糖差
+        amplitudes = np.abs(glucose[seg_starts[1:]] - glucose[seg_starts[:-1]])
+        excursions = amplitudes[amplitudes > sd]
 
-        return np.mean(excursions) if excursions else 0
+        return float(excursions.mean()) if excursions.size else 0.0
 
     def _calculate_daily_patterns(self):
         """計算每日血糖模式"""
-        df = self.glucose_df.copy()
-        df['Hour'] = df['Timestamp'].dt.hour
-        df['Date'] = df['Timestamp'].dt.date
+        df = self.glucose_df
 
         # 每小時平均血糖
         hourly_mean = df.groupby('Hour')['Glucose'].mean()
         self.metrics['Hourly Pattern'] = hourly_mean.to_dict()
 
-        # 每日統計
-        daily_stats = df.groupby('Date')['Glucose'].agg(['mean', 'std', 'min', 'max'])
+        # 每日統計：DateOrdinal 已隨時間排序，sort=False 走不重排的快路徑
+        daily_stats = (df.groupby('DateOrdinal', sort=False, observed=True)['Glucose']
+                         .agg(['mean', 'std', 'min', 'max']))
         self.metrics['Daily Stats'] = {
             'Mean of Daily Means': daily_stats['mean'].mean(),
             'Mean of Daily SDs': daily_stats['std'].mean(),
             'Days Analyzed': len(daily_stats)
         }
 
-    def create_agp(self, save_path: Optional[str] = None) -> plt.Figure:
+    def create_agp(self, save_path: Optional[str] = None, dpi: int = 300) -> plt.Figure:
         """
         創建 AGP (Ambulatory Glucose Profile) 圖表
 
@@ -163,32 +324,32 @@ class CGMAnalyzer:
         Returns:
             matplotlib figure
         """
-        df = self.glucose_df.copy()
-        df['Hour'] = df['Timestamp'].dt.hour + df['Timestamp'].dt.minute / 60
+        df = self.glucose_df
 
-        # 計算百分位數
-        percentiles = [10, 25, 50, 75, 90]
-        hourly_percentiles = {}
-
-        for hour in range(24):
-            hour_data = df[(df['Hour'] >= hour) & (df['Hour'] < hour + 1)]['Glucose']
-            if len(hour_data) > 0:
-                hourly_percentiles[hour] = np.percentile(hour_data, percentiles)
+        # 計算百分位數：單次 groupby-quantile 取代逐小時布林遮罩掃描
+        pcts = (df.groupby('Hour')['Glucose']
+                  .quantile([0.10, 0.25, 0.50, 0.75, 0.90])
+                  .unstack())
 
         # 創建圖表
         fig, ax = plt.subplots(figsize=(12, 6))
 
-        hours = list(hourly_percentiles.keys())
-        if hours:
+        hours = pcts.index.to_numpy()
+        if hours.size:
             # 繪製百分位數帶
-            p10 = [hourly_percentiles[h][0] for h in hours]
-            p25 = [hourly_percentiles[h][1] for h in hours]
-            p50 = [hourly_percentiles[h][2] for h in hours]
-            p75 = [hourly_percentiles[h][3] for h in hours]
-            p90 = [hourly_percentiles[h][4] for h in hours]
-
-            ax.fill_between(hours, p10, p90, alpha=0.2, color='blue', label='10-90%')
-            ax.fill_between(hours, p25, p75, alpha=0.3, color='blue', label='25-75%')
+            p10 = pcts[0.10].to_numpy()
+            p25 = pcts[0.25].to_numpy()
+            p50 = pcts[0.50].to_numpy()
+            p75 = pcts[0.75].to_numpy()
+            p90 = pcts[0.90].to_numpy()
+
+            band_outer = ax.fill_between(hours, p10, p90, alpha=0.2,
+                                         color='blue', label='10-90%')
+            band_inner = ax.fill_between(hours, p25, p75, alpha=0.3,
+                                         color='blue', label='25-75%')
+            # 百分位數帶為大面積半透明區塊，直接像素化合成
+            band_outer.set_rasterized(True)
+            band_inner.set_rasterized(True)
             ax.plot(hours, p50, 'b-', linewidth=2, label='Median')
 
             # 添加目標範圍
@@ -205,12 +366,12 @@ class CGMAnalyzer:
         ax.grid(True, alpha=0.3)
 
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
             print(f"✓ AGP 圖表已儲存至：{save_path}")
 
         return fig
 
-    def create_daily_overlay(self, save_path: Optional[str] = None) -> plt.Figure:
+    def create_daily_overlay(self, save_path: Optional[str] = None, dpi: int = 300) -> plt.Figure:
         """
         創建每日血糖疊加圖
 
@@ -220,20 +381,25 @@ class CGMAnalyzer:
         Returns:
             matplotlib figure
         """
-        df = self.glucose_df.copy()
-        df['Date'] = df['Timestamp'].dt.date
-        df['TimeOfDay'] = df['Timestamp'].dt.hour + df['Timestamp'].dt.minute / 60
+        df = self.glucose_df
 
         fig, ax = plt.subplots(figsize=(12, 6))
 
-        # 繪製每一天的血糖曲線
-        for date in df['Date'].unique():
-            day_data = df[df['Date'] == date]
-            ax.plot(day_data['TimeOfDay'], day_data['Glucose'],
-                   alpha=0.3, linewidth=0.5)
+        # 繪製每一天的血糖曲線：資料已按時間排序，各日為連續區段，
+        # 以 diff 找出日界後用 O(1) 切片切段，再一次掛上 LineCollection
+        dord = df['DateOrdinal'].to_numpy()
+        tod = df['TimeOfDay'].to_numpy()
+        glucose = df['Glucose'].to_numpy()
+        bounds = np.r_[0, np.flatnonzero(np.diff(dord)) + 1, dord.size]
+        segments = [np.column_stack((tod[a:b], glucose[a:b]))
+                    for a, b in zip(bounds[:-1], bounds[1:])]
+        overlay = LineCollection(segments, alpha=0.3, linewidths=0.5)
+        # 大量半透明線以像素合成一次即可，存檔時不必逐線向量合成
+        overlay.set_rasterized(True)
+        ax.add_collection(overlay)
 
         # 添加平均線
-        hourly_mean = df.groupby(df['TimeOfDay'].astype(int))['Glucose'].mean()
+        hourly_mean = df.groupby('Hour')['Glucose'].mean()
         ax.plot(hourly_mean.index, hourly_mean.values, 'r-',
                linewidth=2, label='Average')
 
@@ -249,12 +415,12 @@ class CGMAnalyzer:
         ax.grid(True, alpha=0.3)
 
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
             print(f"✓ Daily overlay 圖表已儲存至：{save_path}")
 
         return fig
 
-    def create_time_in_range_pie(self, save_path: Optional[str] = None) -> plt.Figure:
+    def create_time_in_range_pie(self, save_path: Optional[str] = None, dpi: int = 300) -> plt.Figure:
         """
         創建 Time in Range 圓餅圖
 
@@ -301,43 +467,59 @@ class CGMAnalyzer:
         plt.tight_layout()
 
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
             print(f"✓ TIR 圓餅圖已儲存至：{save_path}")
 
         return fig
 
-    def generate_report(self, output_dir: str = "./report"):
+    def generate_report(self, output_dir: str = "./report",
+                        figures: Tuple[str, ...] = ('agp', 'daily_overlay', 'tir_pie'),
+                        dpi: int = 300):
         """
         生成完整分析報告
 
         Args:
             output_dir: 輸出目錄
+            figures: 要生成的圖表（批次只取指標時可傳空 tuple 跳過繪圖）
+            dpi: 圖表解析度
         """
         os.makedirs(output_dir, exist_ok=True)
 
-        # 生成所有圖表
-        self.create_agp(os.path.join(output_dir, "agp.png"))
-        self.create_daily_overlay(os.path.join(output_dir, "daily_overlay.png"))
-        self.create_time_in_range_pie(os.path.join(output_dir, "tir_pie.png"))
+        # 只生成被要求的圖表
+        if 'agp' in figures:
+            self.create_agp(os.path.join(output_dir, "agp.png"), dpi=dpi)
+        if 'daily_overlay' in figures:
+            self.create_daily_overlay(os.path.join(output_dir, "daily_overlay.png"), dpi=dpi)
+        if 'tir_pie' in figures:
+            self.create_time_in_range_pie(os.path.join(output_dir, "tir_pie.png"), dpi=dpi)
 
         # 儲存指標為 JSON
         metrics_file = os.path.join(output_dir, "metrics.json")
-        with open(metrics_file, 'w', encoding='utf-8') as f:
-            # 轉換 numpy 類型為標準 Python 類型
-            clean_metrics = {}
-            for key, value in self.metrics.items():
-                if isinstance(value, (np.integer, np.floating)):
-                    clean_metrics[key] = float(value)
-                elif isinstance(value, np.ndarray):
-                    clean_metrics[key] = value.tolist()
-                elif isinstance(value, dict):
-                    clean_metrics[key] = {k: float(v) if isinstance(v, (np.integer, np.floating))
-                                         else v for k, v in value.items()}
-                else:
-                    clean_metrics[key] = value
-
-            json.dump(clean_metrics, f, indent=2, ensure_ascii=False)
-            print(f"✓ 指標已儲存至：{metrics_file}")
+        if orjson is not None:
+            # orjson 在 C 層序列化 numpy 純量/陣列，無需逐值型別探測
+            with open(metrics_file, 'wb') as f:
+                f.write(orjson.dumps(
+                    self.metrics,
+                    option=(orjson.OPT_SERIALIZE_NUMPY |
+                            orjson.OPT_NON_STR_KEYS |
+                            orjson.OPT_INDENT_2)))
+        else:
+            with open(metrics_file, 'w', encoding='utf-8') as f:
+                # 轉換 numpy 類型為標準 Python 類型
+                clean_metrics = {}
+                for key, value in self.metrics.items():
+                    if isinstance(value, (np.integer, np.floating)):
+                        clean_metrics[key] = float(value)
+                    elif isinstance(value, np.ndarray):
+                        clean_metrics[key] = value.tolist()
+                    elif isinstance(value, dict):
+                        clean_metrics[key] = {k: float(v) if isinstance(v, (np.integer, np.floating))
+                                             else v for k, v in value.items()}
+                    else:
+                        clean_metrics[key] = value
+
+                json.dump(clean_metrics, f, indent=2, ensure_ascii=False)
+        print(f"✓ 指標已儲存至：{metrics_file}")
 
         # 生成文字報告
         report_file = os.path.join(output_dir, "report.txt")
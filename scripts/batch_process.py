@@ -8,10 +8,11 @@ import os
 import sys
 import glob
 import json
+import multiprocessing
 import yaml
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
 import pandas as pd
 import numpy as np
@@ -22,6 +23,54 @@ sys.path.append(os.path.dirname(__file__))
 from analyze_cgm import CGMAnalyzer
 from validate import CGMValidator
 
+# libyaml 的 C parser；繫結不存在時退回純 Python SafeLoader
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _worker_init():
+    """worker 預熱：重模組只在行程啟動時匯入一次，之後重複使用"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+
+
+def _process_single_file(file_path: str, output_root: str,
+                         figures: Tuple[str, ...], dpi: int) -> Dict:
+    """處理單個檔案（模組層級函數，pickle 成本低）"""
+    try:
+        # 創建分析器
+        analyzer = CGMAnalyzer(file_path)
+
+        # 計算指標
+        metrics = analyzer.calculate_metrics()
+
+        # 生成個人報告目錄
+        file_name = Path(file_path).stem
+        output_dir = os.path.join(output_root, file_name)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # 生成報告（依設定決定要畫哪些圖）
+        analyzer.generate_report(output_dir, figures=figures, dpi=dpi)
+
+        # 返回結果：完整 metrics 已寫入 metrics.json，
+        # 只回傳比較報告需要的純量摘要，避免主行程隨檔案數累積記憶體
+        summary_keys = ("Mean Glucose", "TIR", "TAR", "TBR", "CV", "GMI", "GRI")
+        return {
+            "file": file_path,
+            "name": file_name,
+            "status": "success",
+            "metrics_summary": {k: metrics.get(k, np.nan) for k in summary_keys},
+            "output_dir": output_dir
+        }
+
+    except Exception as e:
+        return {
+            "file": file_path,
+            "status": "error",
+            "error": str(e)
+        }
+
 
 class BatchProcessor:
     """批次處理器"""
@@ -39,14 +88,17 @@ class BatchProcessor:
             "batch_size": 10,
             "output_dir": "./batch_output",
             "validate_first": True,
-            "generate_comparison": True
+            "generate_comparison": True,
+            # 設為 [] 可跳過繪圖，只產出指標（比較報告僅需 metrics）
+            "figures": ["agp", "daily_overlay", "tir_pie"],
+            "dpi": 300
         }
 
         if config_file and os.path.exists(config_file):
             try:
                 with open(config_file, 'r', encoding='utf-8') as f:
                     if config_file.endswith('.yaml'):
-                        user_config = yaml.safe_load(f)
+                        user_config = yaml.load(f, Loader=_YamlLoader)
                     else:
                         user_config = json.load(f)
 
@@ -87,30 +139,23 @@ class BatchProcessor:
         # 批次處理
         print(f"\n🔄 開始批次處理（最大並行：{self.config['max_parallel']}）...")
 
-        with ProcessPoolExecutor(max_workers=self.config["max_parallel"]) as executor:
-            # 提交任務
-            futures = {}
-            for file_path in files:
-                future = executor.submit(self._process_single_file, file_path)
-                futures[future] = file_path
-
-            # 處理結果
-            with tqdm(total=len(files), desc="處理進度") as pbar:
-                for future in as_completed(futures):
-                    file_path = futures[future]
-
-                    try:
-                        result = future.result(timeout=300)  # 5 分鐘超時
-                        self.results.append(result)
-                    except Exception as e:
-                        error = {
-                            "file": file_path,
-                            "error": str(e)
-                        }
-                        self.errors.append(error)
-                        print(f"\n❌ 處理失敗：{file_path} - {e}")
-
-                    pbar.update(1)
+        # 常駐 worker pool：initializer 預熱匯入，imap_unordered + chunksize
+        # 自動分塊派工（work stealing），完成順序不受提交順序牽制
+        worker = partial(_process_single_file,
+                         output_root=self.config["output_dir"],
+                         figures=tuple(self.config["figures"]),
+                         dpi=self.config["dpi"])
+        chunksize = max(1, len(files) // (4 * self.config["max_parallel"]))
+        ctx = multiprocessing.get_context('spawn')
+
+        with ctx.Pool(self.config["max_parallel"], initializer=_worker_init) as pool:
+            for result in tqdm(pool.imap_unordered(worker, files, chunksize=chunksize),
+                               total=len(files), desc="處理進度"):
+                if result["status"] == "success":
+                    self.results.append(result)
+                else:
+                    self.errors.append(result)
+                    print(f"\n❌ 處理失敗：{result['file']} - {result['error']}")
 
         # 生成比較報告
         if self.config["generate_comparison"] and len(self.results) > 1:
@@ -144,39 +189,6 @@ class BatchProcessor:
 
         return valid_files
 
-    def _process_single_file(self, file_path: str) -> Dict:
-        """處理單個檔案"""
-        try:
-            # 創建分析器
-            analyzer = CGMAnalyzer(file_path)
-
-            # 計算指標
-            metrics = analyzer.calculate_metrics()
-
-            # 生成個人報告目錄
-            file_name = Path(file_path).stem
-            output_dir = os.path.join(self.config["output_dir"], file_name)
-            os.makedirs(output_dir, exist_ok=True)
-
-            # 生成報告
-            analyzer.generate_report(output_dir)
-
-            # 返回結果
-            return {
-                "file": file_path,
-                "name": file_name,
-                "status": "success",
-                "metrics": metrics,
-                "output_dir": output_dir
-            }
-
-        except Exception as e:
-            return {
-                "file": file_path,
-                "status": "error",
-                "error": str(e)
-            }
-
     def _generate_comparison_report(self):
         """生成比較報告"""
         comparison_data = []
@@ -184,15 +196,16 @@ class BatchProcessor:
         # 收集所有成功處理的結果
         for result in self.results:
             if result["status"] == "success":
+                summary = result["metrics_summary"]
                 row = {
                     "File": result["name"],
-                    "Mean Glucose": result["metrics"].get("Mean Glucose", np.nan),
-                    "TIR (%)": result["metrics"].get("TIR", np.nan),
-                    "TAR (%)": result["metrics"].get("TAR", np.nan),
-                    "TBR (%)": result["metrics"].get("TBR", np.nan),
-                    "CV (%)": result["metrics"].get("CV", np.nan),
-                    "GMI": result["metrics"].get("GMI", np.nan),
-                    "GRI": result["metrics"].get("GRI", np.nan)
+                    "Mean Glucose": summary.get("Mean Glucose", np.nan),
+                    "TIR (%)": summary.get("TIR", np.nan),
+                    "TAR (%)": summary.get("TAR", np.nan),
+                    "TBR (%)": summary.get("TBR", np.nan),
+                    "CV (%)": summary.get("CV", np.nan),
+                    "GMI": summary.get("GMI", np.nan),
+                    "GRI": summary.get("GRI", np.nan)
                 }
                 comparison_data.append(row)
 
@@ -249,24 +262,29 @@ class BatchProcessor:
             # 建議
             f.write("## 建議\n\n")
 
-            # 找出需要改善的檔案
-            need_improvement = []
+            # 找出需要改善的檔案：以欄級布林遮罩一次判定，
+            # 只對命中的列組裝訊息（NaN 比較為 False，等同原本的預設值行為）
+            tir_bad = df["TIR (%)"] < 70
+            tbr_bad = df["TBR (%)"] > 4
+            cv_bad = df["CV (%)"] > 36
+            any_bad = tir_bad | tbr_bad | cv_bad
 
-            for _, row in df.iterrows():
+            need_improvement = []
+            for file_name, is_tir, is_tbr, is_cv in zip(
+                    df.loc[any_bad, "File"], tir_bad[any_bad],
+                    tbr_bad[any_bad], cv_bad[any_bad]):
                 issues = []
-
-                if row.get("TIR (%)", 100) < 70:
+                if is_tir:
                     issues.append("TIR 低於目標")
-                if row.get("TBR (%)", 0) > 4:
+                if is_tbr:
                     issues.append("低血糖時間過多")
-                if row.get("CV (%)", 0) > 36:
+                if is_cv:
                     issues.append("血糖變異性過高")
 
-                if issues:
-                    need_improvement.append({
-                        "file": row["File"],
-                        "issues": issues
-                    })
+                need_improvement.append({
+                    "file": file_name,
+                    "issues": issues
+                })
 
             if need_improvement:
                 f.write("### 需要關注的檔案：\n\n")
@@ -297,20 +315,16 @@ class BatchProcessor:
             all_metrics = []
             for result in self.results:
                 if result["status"] == "success":
-                    all_metrics.append(result["metrics"])
+                    all_metrics.append(result["metrics_summary"])
 
             if all_metrics:
-                # 計算平均值
-                avg_metrics = {}
-                keys = ["Mean Glucose", "TIR", "TAR", "TBR", "CV", "GMI", "GRI"]
-
-                for key in keys:
-                    values = [m.get(key, np.nan) for m in all_metrics]
-                    values = [v for v in values if not np.isnan(v)]
-                    if values:
-                        avg_metrics[key] = float(np.mean(values))
-
-                summary["average_metrics"] = avg_metrics
+                # 一次建表後以 C 層 mean 計算平均（skipna 天然處理 NaN），
+                # 全為 NaN 的欄位如舊版一樣不輸出
+                mdf = pd.DataFrame(all_metrics,
+                                   columns=["Mean Glucose", "TIR", "TAR",
+                                            "TBR", "CV", "GMI", "GRI"])
+                summary["average_metrics"] = {
+                    key: float(value) for key, value in mdf.mean().dropna().items()}
 
         # 儲存總結
         summary_file = os.path.join(self.config["output_dir"], "batch_summary.json")
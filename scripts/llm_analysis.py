@@ -4,28 +4,113 @@ CGM LLM 智能分析報告生成器
 使用 OpenAI API 生成個人化的血糖管理建議
 """
 
+import functools
+import hashlib
+import random
 import json
+import shelve
 import sys
 import os
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
+import numpy as np
 import pandas as pd
+import openai
 from openai import OpenAI
 
+# 語意快取：user 提示的嵌入餘弦相似度超過此值即視為同一問題
+SEMANTIC_SIMILARITY_THRESHOLD = 0.97
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# 完全相同提示的磁碟快取保存期限（30 天）
+EXACT_CACHE_TTL = 30 * 24 * 3600
+
+
+# 重試參數：指數退避上限與次數；429/5xx 屬暫時性錯誤，直接放棄會
+# 浪費同一報告中已成功的呼叫
+MAX_RETRIES = 6
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 32.0
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError,
+                     openai.InternalServerError)
+
+
+def _retry_after_seconds(error) -> Optional[float]:
+    """從錯誤回應讀取 Retry-After 標頭（秒）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+
+def _with_retries(call: Callable):
+    """執行 API 呼叫，暫時性錯誤時以指數退避＋抖動重試，並尊重 Retry-After"""
+    delay = BACKOFF_INITIAL
+    for attempt in range(MAX_RETRIES):
+        try:
+            return call()
+        except _RETRYABLE_ERRORS as error:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            wait = delay * (0.5 + random.random())
+            server_wait = _retry_after_seconds(error)
+            if server_wait is not None:
+                wait = max(wait, server_wait)
+            time.sleep(min(wait, BACKOFF_MAX))
+            delay = min(delay * 2, BACKOFF_MAX)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_text(path: Path) -> str:
+    """讀取知識文件；同一路徑整個行程只讀一次"""
+    return path.read_text(encoding='utf-8')
+
 class CGMLLMAnalyzer:
     """CGM LLM 分析器"""
 
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
+    def __init__(self, api_key: str, model: str = "gpt-4o",
+                 cache_dir: Optional[str] = None,
+                 simple_model: str = "gpt-4o-mini",
+                 route_policy: Optional[Callable[[str], str]] = None):
         """
         初始化 LLM 分析器
 
         Args:
             api_key: OpenAI API 金鑰
-            model: 使用的模型名稱
+            model: 使用的模型名稱（綜合判讀類任務）
+            cache_dir: 語意快取目錄（預設 ~/.cache/cgm_llm）
+            simple_model: 模板填空類任務使用的廉價模型
+            route_policy: 自訂路由 callable（任務名 -> 模型名），覆寫預設分層
         """
         self.client = OpenAI(api_key=api_key)
         self.model = model
+        self.simple_model = simple_model
+        self.route_policy = route_policy
         self.analysis_results = {}
+        self.cache_dir = Path(cache_dir or
+                              os.path.expanduser("~/.cache/cgm_llm"))
+        self._semantic_entries = None
+        self._knowledge = None
+        self.last_usage = None  # 最近一次呼叫的 token 用量（含 cached_tokens）
+
+    def _model_for(self, task: str) -> str:
+        """任務分層路由：數值評述類交給廉價模型，綜合判讀維持主模型"""
+        if self.route_policy is not None:
+            return self.route_policy(task)
+        # TIR 評述與胰島素統計屬模板填空，mini 成本約 1/20、吞吐加倍；
+        # AGP 模式判讀與個人化建議先留在主模型，待評估足夠再降級
+        if task in ("tir", "insulin"):
+            return self.simple_model
+        return self.model
 
     def load_metrics(self, metrics_file: str) -> Dict:
         """載入分析指標"""
@@ -33,30 +118,182 @@ class CGMLLMAnalyzer:
             return json.load(f)
 
     def load_knowledge(self, knowledge_dir: str = "../knowledge") -> str:
-        """載入專業知識庫"""
+        """載入專業知識庫（首次讀取後快取在實例上）"""
+        if self._knowledge is not None:
+            return self._knowledge
+
+        # 兩份文件互不相依、純 I/O 等待，並行讀取；
+        # _read_text 另有模組層快取，跨實例也不重讀
+        sources = [
+            ("【CGM 指標參考】",
+             Path(knowledge_dir) / "cgm_metrics.md"),
+            ("【糖尿病管理指南】",
+             Path(knowledge_dir) / "diabetes_guidelines.md"),
+        ]
+        # 一次 scandir 列出目錄取代逐檔 exists()（每檔一個 stat 系統呼叫）
+        try:
+            available = {entry.name for entry in os.scandir(knowledge_dir)}
+        except FileNotFoundError:
+            available = set()
+        existing = [(title, path) for title, path in sources
+                    if path.name in available]
+
         knowledge_content = ""
+        if existing:
+            with ThreadPoolExecutor(max_workers=len(existing)) as executor:
+                texts = executor.map(_read_text, (p for _, p in existing))
+                for (title, _), text in zip(existing, texts):
+                    knowledge_content += f"{title}\n{text}\n\n"
 
-        # 載入 CGM 指標參考
-        metrics_file = os.path.join(knowledge_dir, "cgm_metrics.md")
-        if os.path.exists(metrics_file):
-            with open(metrics_file, 'r', encoding='utf-8') as f:
-                knowledge_content += f"【CGM 指標參考】\n{f.read()}\n\n"
+        self._knowledge = knowledge_content
+        return knowledge_content
 
-        # 載入糖尿病管理指南
-        guidelines_file = os.path.join(knowledge_dir, "diabetes_guidelines.md")
-        if os.path.exists(guidelines_file):
-            with open(guidelines_file, 'r', encoding='utf-8') as f:
-                knowledge_content += f"【糖尿病管理指南】\n{f.read()}\n\n"
+    def _system_preamble(self) -> str:
+        """跨任務共用的 system 前綴：角色描述 + 知識庫
 
-        return knowledge_content
+        OpenAI 會自動快取 ≥1024 token 的相同提示前綴並以約半價計費，
+        前提是前綴逐位元組一致——因此所有任務共用同一段 system 訊息，
+        任務專屬的角色描述移到 user 訊息開頭。
+        """
+        return ("你是一位資深的糖尿病照護團隊成員，具備醫師、營養師與"
+                "衛教師的專業知識，擅長解讀 CGM 數據並提供個人化建議。\n\n"
+                + self.load_knowledge())
+
+    def _complete(self, messages: List[Dict], max_tokens: int = 1500,
+                  on_delta=None, model: Optional[str] = None) -> str:
+        """以串流方式接收完成內容，逐段累積（可經 on_delta 即時轉發）"""
+        def _run() -> str:
+            stream = self.client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+                # 最後一個 chunk 帶 usage，保留 cached_tokens 供確認前綴快取生效
+                if getattr(chunk, "usage", None) is not None:
+                    self.last_usage = chunk.usage
+
+            return "".join(parts)
+
+        # 串流中斷也視為一次失敗、整段重試
+        return _with_retries(_run)
+
+    def _load_semantic_cache(self) -> List[Dict]:
+        """載入語意快取（首次使用時讀入記憶體）"""
+        if self._semantic_entries is None:
+            self._semantic_entries = []
+            cache_file = self.cache_dir / "semantic_cache.jsonl"
+            if cache_file.exists():
+                for line in cache_file.read_text(encoding="utf-8").splitlines():
+                    if line.strip():
+                        self._semantic_entries.append(json.loads(line))
+        return self._semantic_entries
+
+    def _embed(self, text: str) -> np.ndarray:
+        """取得文字的正規化嵌入向量"""
+        response = _with_retries(
+            lambda: self.client.embeddings.create(model=EMBEDDING_MODEL,
+                                                  input=text))
+        embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def _exact_cache_get(self, key: str) -> Optional[str]:
+        """查詢完全相同提示的磁碟快取（過期視為未命中）"""
+        try:
+            with shelve.open(str(self.cache_dir / "exact_cache")) as db:
+                item = db.get(key)
+        except Exception:
+            return None
+
+        if item and time.time() - item[0] < EXACT_CACHE_TTL:
+            return item[1]
+        return None
+
+    def _exact_cache_put(self, key: str, response: str):
+        """寫入完全相同提示的磁碟快取"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with shelve.open(str(self.cache_dir / "exact_cache")) as db:
+                db[key] = (time.time(), response)
+        except Exception:
+            pass  # 快取寫入失敗不影響回覆
+
+    def _cached_complete(self, messages: List[Dict], max_tokens: int = 1500,
+                         model: Optional[str] = None) -> str:
+        """快取包裝：先查完全相同提示的磁碟快取（無 API 成本），
+        再以嵌入餘弦相似度比對相似提示，都未命中才呼叫 LLM"""
+        model = model or self.model
+        key = hashlib.sha256(json.dumps([model, messages],
+                                        sort_keys=True,
+                                        ensure_ascii=False).encode()).hexdigest()
+
+        # 快路徑：逐位元組相同的提示 → 磁碟字典查找取代整趟 LLM 呼叫
+        cached = self._exact_cache_get(key)
+        if cached is not None:
+            return cached
+
+        entries = self._load_semantic_cache()
+
+        # 語意路徑：以 user 提示的嵌入比對相似問題
+        embedding = None
+        try:
+            embedding = self._embed(messages[-1]["content"])
+            for entry in entries:
+                if entry.get("model") != model or not entry.get("embedding"):
+                    continue
+                similarity = float(embedding @ np.asarray(entry["embedding"],
+                                                          dtype=np.float32))
+                if similarity > SEMANTIC_SIMILARITY_THRESHOLD:
+                    self._exact_cache_put(key, entry["response"])
+                    return entry["response"]
+        except Exception:
+            pass  # 嵌入失敗時直接走 LLM，不影響主流程
+
+        response = self._complete(messages, max_tokens, model=model)
+        self._exact_cache_put(key, response)
+
+        entry = {
+            "key": key,
+            "model": model,
+            "embedding": embedding.tolist() if embedding is not None else None,
+            "response": response
+        }
+        entries.append(entry)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_dir / "semantic_cache.jsonl", "a",
+                      encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            pass  # 快取寫入失敗不影響回覆
+
+        return response
+
+    def _agp_messages(self, metrics: Dict) -> List[Dict]:
+        """組裝 AGP 模式分析的對話訊息"""
+        # 單行「時:值」表即可表達 24 小時模式——縮排 JSON 多耗約 400 個
+        # 輸入 token 在空白與重複鍵上，模型對緊湊形式的理解相同
+        hourly = metrics.get('Hourly Pattern', {})
+        # metrics.json 反序列化後的鍵是字串，要按數值排序才是時間順序
+        hourly_line = ",".join(
+            f"{int(hour):02d}:{value:.0f}"
+            for hour, value in sorted(hourly.items(), key=lambda kv: int(kv[0])))
 
-    def analyze_agp_pattern(self, metrics: Dict) -> str:
-        """分析 AGP 模式"""
         prompt = f"""
         根據以下 CGM 數據的每小時血糖模式，分析血糖控制的特徵和問題：
 
-        每小時平均血糖（mg/dL）：
-        {json.dumps(metrics.get('Hourly Pattern', {}), indent=2)}
+        每小時平均血糖（時:mg/dL）：
+        {hourly_line}
 
         整體指標：
         - 平均血糖：{metrics.get('Mean Glucose', 0):.1f} mg/dL
@@ -72,20 +309,18 @@ class CGMLLMAnalyzer:
         請用繁體中文回答，並使用專業但易懂的語言。
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一位專業的糖尿病管理專家，擅長分析 CGM 數據並提供個人化建議。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
+        return [
+            {"role": "system", "content": self._system_preamble()},
+            {"role": "user",
+             "content": "請以專業糖尿病管理專家的角度回答。\n" + prompt}
+        ]
 
-        return response.choices[0].message.content
+    def analyze_agp_pattern(self, metrics: Dict) -> str:
+        """分析 AGP 模式"""
+        return self._cached_complete(self._agp_messages(metrics))
 
-    def analyze_time_in_range(self, metrics: Dict) -> str:
-        """分析 Time in Range"""
+    def _tir_messages(self, metrics: Dict) -> List[Dict]:
+        """組裝 Time in Range 分析的對話訊息"""
         prompt = f"""
         請分析以下 CGM Time in Range 數據：
 
@@ -112,20 +347,20 @@ class CGMLLMAnalyzer:
         請用繁體中文回答。
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一位經驗豐富的內分泌科醫師，專精於糖尿病管理。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1500
-        )
+        return [
+            {"role": "system", "content": self._system_preamble()},
+            {"role": "user",
+             "content": "請以經驗豐富的內分泌科醫師的角度回答。\n" + prompt}
+        ]
 
-        return response.choices[0].message.content
+    def analyze_time_in_range(self, metrics: Dict) -> str:
+        """分析 Time in Range"""
+        return self._cached_complete(self._tir_messages(metrics),
+                                     model=self._model_for("tir"))
 
-    def generate_personalized_recommendations(self, metrics: Dict, patient_profile: Optional[Dict] = None) -> str:
-        """生成個人化建議"""
+    def _recommendation_messages(self, metrics: Dict,
+                                 patient_profile: Optional[Dict] = None) -> List[Dict]:
+        """組裝個人化建議的對話訊息"""
         profile_info = ""
         if patient_profile:
             profile_info = f"""
@@ -177,37 +412,123 @@ class CGMLLMAnalyzer:
         請提供實用、具體、可執行的建議，使用繁體中文。
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一位資深的糖尿病照護團隊成員，包含醫師、營養師和衛教師的專業知識。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-
-        return response.choices[0].message.content
+        return [
+            {"role": "system", "content": self._system_preamble()},
+            {"role": "user",
+             "content": "請以糖尿病照護團隊（醫師、營養師、衛教師）的角度回答。\n"
+                        + prompt}
+        ]
 
-    def generate_comprehensive_report(self, metrics: Dict, output_file: str = "llm_report.md"):
-        """生成完整的 LLM 分析報告"""
-        print("正在生成 AI 分析報告...")
+    def generate_personalized_recommendations(self, metrics: Dict,
+                                              patient_profile: Optional[Dict] = None) -> str:
+        """生成個人化建議"""
+        return self._cached_complete(
+            self._recommendation_messages(metrics, patient_profile),
+            max_tokens=2000)
 
-        # 載入專業知識（如果存在）
-        knowledge = self.load_knowledge()
+    def _complete_batch(self, requests: Dict[str, tuple],
+                        poll_interval: int = 30) -> Dict[str, str]:
+        """以 OpenAI Batch API 送出多組提示（約半價，適合非互動批次）
 
-        # 執行各項分析
-        print("  分析 AGP 模式...")
-        agp_analysis = self.analyze_agp_pattern(metrics)
+        Args:
+            requests: {custom_id: (messages, max_tokens)}
+            poll_interval: 輪詢間隔（秒）
 
-        print("  分析 Time in Range...")
-        tir_analysis = self.analyze_time_in_range(metrics)
+        Returns:
+            {custom_id: 完成內容}
+        """
+        lines = [json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "messages": messages,
+                "temperature": 0.7,
+                "max_tokens": max_tokens
+            }
+        }, ensure_ascii=False) for custom_id, (messages, max_tokens) in requests.items()]
+
+        batch_file = _with_retries(lambda: self.client.files.create(
+            file=("cgm_batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"))
+        batch = _with_retries(lambda: self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"))
+
+        # 輪詢直到批次結束
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = _with_retries(
+                lambda: self.client.batches.retrieve(batch.id))
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch 任務未完成：{batch.status}")
+
+        # 單一請求失敗時 error 非空、response 可能缺漏，
+        # 不檢查就取值會在等了數小時後炸出 KeyError
+        results = {}
+        failed = []
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            custom_id = item.get("custom_id", "<無 custom_id>")
+            error = item.get("error")
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if error or not body.get("choices"):
+                failed.append(f"{custom_id}: {error or '回應缺少 choices'}")
+                continue
+            results[custom_id] = body["choices"][0]["message"]["content"]
+
+        missing = [cid for cid in requests if cid not in results]
+        for cid in missing:
+            if not any(f.startswith(f"{cid}:") for f in failed):
+                failed.append(f"{cid}: 輸出檔中找不到對應結果")
+        if failed:
+            raise RuntimeError("Batch 部分請求失敗：" + "; ".join(failed))
+        return results
+
+    def generate_comprehensive_report(self, metrics: Dict, output_file: str = "llm_report.md",
+                                      mode: str = "interactive"):
+        """生成完整的 LLM 分析報告
 
-        print("  生成個人化建議...")
-        recommendations = self.generate_personalized_recommendations(metrics)
+        Args:
+            metrics: 分析指標
+            output_file: 輸出檔案路徑
+            mode: "interactive" 即時並行呼叫；"batch" 走 Batch API（半價、可等待）
+        """
+        print("正在生成 AI 分析報告...")
 
-        # 組合報告
-        report = f"""# CGM 智能分析報告
+        if mode == "batch":
+            # 非互動情境：三個提示一次送進 Batch API，成本約為同步呼叫的一半
+            print("  以 Batch API 送出三項分析（完成前會持續輪詢）...")
+            sections = self._complete_batch({
+                "agp": (self._agp_messages(metrics), 1500),
+                "tir": (self._tir_messages(metrics), 1500),
+                "reco": (self._recommendation_messages(metrics), 2000)
+            })
+            get_agp = lambda: sections["agp"]  # noqa: E731
+            get_tir = lambda: sections["tir"]  # noqa: E731
+            get_reco = lambda: sections["reco"]  # noqa: E731
+            executor = None
+        else:
+            # 執行各項分析：三個提示彼此獨立且純 I/O 等待，
+            # 並行送出後整體延遲約等於最慢的一個，而非三者相加
+            print("  並行分析 AGP 模式 / Time in Range / 個人化建議...")
+            executor = ThreadPoolExecutor(max_workers=3)
+            get_agp = executor.submit(self._cached_complete,
+                                      self._agp_messages(metrics)).result
+            get_tir = executor.submit(self._cached_complete,
+                                      self._tir_messages(metrics),
+                                      model=self._model_for("tir")).result
+            get_reco = executor.submit(self._cached_complete,
+                                       self._recommendation_messages(metrics),
+                                       max_tokens=2000).result
+
+        header = f"""# CGM 智能分析報告
 
 生成時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 分析模型：{self.model}
@@ -224,25 +545,9 @@ class CGMLLMAnalyzer:
 
 ---
 
-## 🔍 AGP 模式分析
-
-{agp_analysis}
-
----
-
-## 📈 Time in Range 評估
-
-{tir_analysis}
-
----
-
-## 💡 個人化管理建議
-
-{recommendations}
-
----
+"""
 
-## ⚠️ 重要提醒
+        footer = """## ⚠️ 重要提醒
 
 1. **醫療諮詢**：本報告僅供參考，所有治療調整應在醫療專業人員指導下進行
 2. **持續監測**：建議定期（每2-4週）重新評估血糖控制情況
@@ -262,9 +567,36 @@ class CGMLLMAnalyzer:
 *本報告由 AI 輔助生成，結合了最新的糖尿病管理指南和 CGM 數據分析最佳實踐。*
 """
 
-        # 儲存報告
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(report)
+        # 增量寫出報告：標頭先落盤，各節完成即寫入，
+        # 不必等全部完成才開始組合整份報告
+        report_parts = [header]
+        try:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(header)
+
+                sections_out = {}
+                for title, name, getter in (
+                        ("## 🔍 AGP 模式分析", "agp", get_agp),
+                        ("## 📈 Time in Range 評估", "tir", get_tir),
+                        ("## 💡 個人化管理建議", "reco", get_reco)):
+                    text = getter()
+                    sections_out[name] = text
+                    part = f"{title}\n\n{text}\n\n---\n\n"
+                    f.write(part)
+                    f.flush()
+                    report_parts.append(part)
+                    print(f"  ✓ {title[3:]} 完成")
+
+                f.write(footer)
+                report_parts.append(footer)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        agp_analysis = sections_out["agp"]
+        tir_analysis = sections_out["tir"]
+        recommendations = sections_out["reco"]
+        report = "".join(report_parts)
 
         print(f"✓ AI 分析報告已儲存至：{output_file}")
 
@@ -304,7 +636,7 @@ class CGMLLMAnalyzer:
         分析以下胰島素使用數據並提供優化建議：
 
         胰島素使用統計：
-        {json.dumps(insulin_summary, indent=2, ensure_ascii=False)}
+        {json.dumps(insulin_summary, separators=(',', ':'), ensure_ascii=False)}
 
         血糖控制結果：
         - TIR: {metrics.get('TIR', 0):.1f}%
@@ -320,28 +652,33 @@ class CGMLLMAnalyzer:
         使用繁體中文回答。
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
+        response = _with_retries(lambda: self.client.chat.completions.create(
+            model=self._model_for("insulin"),
             messages=[
-                {"role": "system", "content": "你是一位胰島素治療專家。"},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": self._system_preamble()},
+                {"role": "user",
+                 "content": "請以胰島素治療專家的角度回答。\n" + prompt}
             ],
             temperature=0.7,
             max_tokens=1000
-        )
+        ))
 
         return response.choices[0].message.content
 
 def main():
     """主函數"""
-    if len(sys.argv) < 3:
-        print("使用方法：python llm_analysis.py <metrics.json> <api_key> [model]")
+    args = [a for a in sys.argv[1:] if a != "--batch"]
+    mode = "batch" if "--batch" in sys.argv else "interactive"
+
+    if len(args) < 2:
+        print("使用方法：python llm_analysis.py <metrics.json> <api_key> [model] [--batch]")
         print("範例：python llm_analysis.py metrics.json sk-xxx gpt-4o")
+        print("      --batch 使用 OpenAI Batch API（約半價，適合非即時批次）")
         sys.exit(1)
 
-    metrics_file = sys.argv[1]
-    api_key = sys.argv[2]
-    model = sys.argv[3] if len(sys.argv) > 3 else "gpt-4o"
+    metrics_file = args[0]
+    api_key = args[1]
+    model = args[2] if len(args) > 2 else "gpt-4o"
 
     if not os.path.exists(metrics_file):
         print(f"錯誤：找不到檔案 {metrics_file}")
@@ -361,7 +698,7 @@ def main():
 
         # 生成報告
         print("開始 AI 分析...")
-        report = analyzer.generate_comprehensive_report(metrics)
+        report = analyzer.generate_comprehensive_report(metrics, mode=mode)
 
         print("\n✅ AI 分析完成！")
 
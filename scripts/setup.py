@@ -8,6 +8,16 @@ import os
 import sys
 import json
 import yaml
+
+# orjson 寫出 JSON 比 stdlib 快 5–10 倍；未安裝時退回 stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# libyaml 的 C parser/dumper 比純 Python 實作快約 10 倍；繫結不存在時退回預設
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 from typing import Dict, Optional
 from pathlib import Path
 
@@ -310,13 +320,19 @@ class CGMSetupWizard:
             config_path.parent.mkdir(parents=True, exist_ok=True)
 
             with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(full_config, f, default_flow_style=False,
-                         allow_unicode=True, sort_keys=False)
+                yaml.dump(full_config, f, Dumper=_YamlDumper,
+                          default_flow_style=False,
+                          allow_unicode=True, sort_keys=False)
 
             # 同時儲存為 JSON（備份）
             json_path = str(config_path).replace('.yaml', '.json')
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(full_config, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                with open(json_path, 'wb') as f:
+                    f.write(orjson.dumps(full_config,
+                                         option=orjson.OPT_INDENT_2))
+            else:
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(full_config, f, indent=2, ensure_ascii=False)
 
         except Exception as e:
             print(f"\n❌ 儲存設定失敗：{e}")
@@ -330,7 +346,7 @@ class CGMSetupWizard:
             if self._ask_yes_no("是否要載入現有設定並修改？"):
                 try:
                     with open(self.config_file, 'r', encoding='utf-8') as f:
-                        existing = yaml.safe_load(f)
+                        existing = yaml.load(f, Loader=_YamlLoader)
 
                     # 將現有設定轉換為簡單格式
                     if existing.get("defaults"):
@@ -5,11 +5,98 @@ CGM CSV 檔案分割工具
 """
 
 import pandas as pd
+import numpy as np
 import sys
 import os
 from pathlib import Path
 from typing import Tuple, Optional
 
+# PyArrow 的多執行緒 C++ 解析器比 pandas 快數倍；未安裝時退回 pandas 分塊讀取
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
+
+# 間隔常數（奈秒）：模組層預先算好，驗證時直接做整數比較
+_MINUTE_NS = 60 * 1_000_000_000
+_EXPECTED_INTERVAL_NS = 5 * _MINUTE_NS     # CGM 通常每5分鐘一筆
+_LARGE_GAP_NS = 30 * _MINUTE_NS
+
+
+def _arrow_convert_options() -> "pacsv.ConvertOptions":
+    """所有已知欄位給定明確型別，空字串視為 NaN（與 pandas 一致）
+
+    串流讀取逐塊推斷型別：首塊全空的欄位會被推成 null、全整數的
+    血糖欄會被推成 int64，之後的塊一出現字串或小數就轉換失敗。
+    Date/Time 維持字串（避免被推斷成 date32）。
+    """
+    return pacsv.ConvertOptions(
+        column_types={'Date': pa.string(), 'Time': pa.string(),
+                      'Sensor Glucose (mg/dL)': pa.float64(),
+                      'Event Type': pa.string(),
+                      'Event Subtype': pa.string(),
+                      'Insulin Value (u)': pa.float64(),
+                      'Carb Value (g)': pa.float64(),
+                      'Duration (hh:mm:ss)': pa.string()},
+        strings_can_be_null=True)
+
+
+class _CsvAppendWriter:
+    """逐塊附加寫出 CSV：pyarrow 的多執行緒原生寫入器優先，否則 pandas to_csv"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._arrow_writer = None
+        self._schema = None
+        self._first = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if pacsv is not None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._arrow_writer is None:
+                self._schema = table.schema
+                self._arrow_writer = pacsv.CSVWriter(
+                    self.path, self._schema,
+                    write_options=pacsv.WriteOptions(quoting_style='needed'))
+            else:
+                # 後續塊可能把全空欄位推斷成 null 型別，統一轉回首塊 schema
+                table = table.cast(self._schema)
+            self._arrow_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self._first else 'a',
+                      header=self._first, index=False)
+        self._first = False
+
+    def close(self) -> None:
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+
+
+def _iter_csv_chunks(input_file: str, wanted: set):
+    """逐塊產出輸入檔的 DataFrame：pyarrow 批次串流優先，否則 pandas chunksize"""
+    if pacsv is not None:
+        reader = pacsv.open_csv(
+            input_file,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+            convert_options=_arrow_convert_options())
+        for batch in reader:
+            chunk = batch.to_pandas()
+            keep = [c for c in chunk.columns if c in wanted]
+            yield chunk.loc[:, keep]
+    else:
+        # 明確的 dtype 讓 pandas 跳過型別推斷，數值欄直接進 float32 區塊，
+        # 低基數的事件欄位用 category 省下物件字串
+        dtypes = {'Sensor Glucose (mg/dL)': 'float32',
+                  'Event Type': 'category',
+                  'Event Subtype': 'category',
+                  'Insulin Value (u)': 'float32',
+                  'Carb Value (g)': 'float32'}
+        yield from pd.read_csv(input_file, chunksize=200_000,
+                               usecols=lambda c: c in wanted,
+                               dtype=dtypes)
+
 def split_csv(input_file: str, output_dir: str = "./output") -> Tuple[Optional[str], Optional[str]]:
     """
     分割 CGM CSV 檔案為血糖數據和事件數據
@@ -25,11 +112,6 @@ def split_csv(input_file: str, output_dir: str = "./output") -> Tuple[Optional[s
         # 創建輸出目錄
         Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-        # 讀取原始數據
-        df = pd.read_csv(input_file)
-        print(f"成功讀取檔案：{input_file}")
-        print(f"總共 {len(df)} 筆記錄")
-
         # 定義血糖數據欄位
         glucose_columns = ['Date', 'Time', 'Sensor Glucose (mg/dL)']
 
@@ -37,41 +119,79 @@ def split_csv(input_file: str, output_dir: str = "./output") -> Tuple[Optional[s
         event_columns = ['Date', 'Time', 'Event Type', 'Event Subtype',
                         'Insulin Value (u)', 'Carb Value (g)', 'Duration (hh:mm:ss)']
 
-        # 分離血糖數據
-        glucose_df = pd.DataFrame()
-        for col in glucose_columns:
-            if col in df.columns:
-                glucose_df[col] = df[col]
-
-        # 移除空白記錄
-        glucose_df = glucose_df.dropna(subset=['Sensor Glucose (mg/dL)'])
-
-        # 分離事件數據
-        event_df = pd.DataFrame()
-        event_cols_present = [col for col in event_columns if col in df.columns]
-        if event_cols_present:
-            event_df = df[event_cols_present].copy()
-            # 只保留有事件的記錄
-            event_df = event_df.dropna(subset=['Event Type'])
-
         # 生成輸出檔案名稱
         base_name = Path(input_file).stem
         glucose_file = os.path.join(output_dir, f"{base_name}_glucose.csv")
         event_file = os.path.join(output_dir, f"{base_name}_events.csv")
 
-        # 儲存檔案
-        if not glucose_df.empty:
-            glucose_df.to_csv(glucose_file, index=False)
-            print(f"✓ 血糖數據已儲存至：{glucose_file} ({len(glucose_df)} 筆記錄)")
+        # 分塊串流處理：峰值記憶體只與 chunksize 相關，
+        # 多月份匯出檔也不會整份載入 RAM
+        wanted = set(glucose_columns) | set(event_columns)
+        total_records = 0
+        glucose_count = 0
+        event_count = 0
+        glucose_writer = _CsvAppendWriter(glucose_file)
+        event_writer = _CsvAppendWriter(event_file)
+
+        try:
+            for chunk in _iter_csv_chunks(input_file, wanted):
+                total_records += len(chunk)
+
+                # 分離血糖數據：Index.intersection 一次選出存在的欄位
+                # （保持定義順序、免逐欄 Python 迴圈），NaN 過濾交給 C 層的 dropna
+                glucose_cols_present = pd.Index(glucose_columns).intersection(
+                    chunk.columns, sort=False)
+                glucose_df = chunk.loc[:, glucose_cols_present].dropna(
+                    subset=['Sensor Glucose (mg/dL)'])
+
+                # 分離事件數據（只保留有事件的記錄）
+                event_df = None
+                event_cols_present = pd.Index(event_columns).intersection(
+                    chunk.columns, sort=False)
+                if len(event_cols_present):
+                    event_df = chunk.loc[:, event_cols_present].dropna(
+                        subset=['Event Type'])
+
+                # 兩個子集都切好才落盤，失敗時不留下半成品檔案
+                glucose_writer.write(glucose_df)
+                glucose_count += len(glucose_df)
+                if event_df is not None:
+                    event_writer.write(event_df)
+                    event_count += len(event_df)
+
+            glucose_writer.close()
+            event_writer.close()
+        except Exception:
+            # 串流中途失敗：關閉寫入器並移除寫到一半的輸出，
+            # 不留下截斷的檔案誤導下游分析
+            for writer, path in ((glucose_writer, glucose_file),
+                                 (event_writer, event_file)):
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        print(f"成功讀取檔案：{input_file}")
+        print(f"總共 {total_records} 筆記錄")
+
+        # 串流寫出後才知道各檔筆數，空檔案在此移除
+        if glucose_count > 0:
+            print(f"✓ 血糖數據已儲存至：{glucose_file} ({glucose_count} 筆記錄)")
         else:
             print("⚠ 未找到血糖數據")
+            if os.path.exists(glucose_file):
+                os.remove(glucose_file)
             glucose_file = None
 
-        if not event_df.empty:
-            event_df.to_csv(event_file, index=False)
-            print(f"✓ 事件數據已儲存至：{event_file} ({len(event_df)} 筆記錄)")
+        if event_count > 0:
+            print(f"✓ 事件數據已儲存至：{event_file} ({event_count} 筆記錄)")
         else:
             print("⚠ 未找到事件數據")
+            if os.path.exists(event_file):
+                os.remove(event_file)
             event_file = None
 
         return event_file, glucose_file
@@ -91,36 +211,58 @@ def validate_glucose_data(file_path: str) -> bool:
         bool: 數據是否有效
     """
     try:
-        df = pd.read_csv(file_path)
+        required_cols = ['Date', 'Time', 'Sensor Glucose (mg/dL)']
+
+        # pyarrow 讀取路徑：多執行緒解析後轉回 pandas，介面不變
+        if pacsv is not None:
+            df = pacsv.read_csv(
+                file_path,
+                read_options=pacsv.ReadOptions(use_threads=True,
+                                               block_size=8 << 20),
+                convert_options=_arrow_convert_options()).to_pandas()
+        else:
+            # 只讀驗證需要的欄位並直接給定 dtype，略過兩段式型別推斷
+            df = pd.read_csv(file_path,
+                             usecols=lambda c: c in set(required_cols),
+                             dtype={'Sensor Glucose (mg/dL)': 'float32'})
 
         # 檢查必要欄位
-        required_cols = ['Date', 'Time', 'Sensor Glucose (mg/dL)']
         missing_cols = [col for col in required_cols if col not in df.columns]
 
         if missing_cols:
             print(f"⚠ 缺少必要欄位：{missing_cols}")
             return False
 
-        # 檢查數據完整性
-        df['Timestamp'] = pd.to_datetime(df['Date'] + ' ' + df['Time'])
+        # 檢查數據完整性：明確的 format 走向量化 C 解析器，
+        # 比逐值推斷格式快一個數量級；秒數欄位缺漏時退回 HH:MM
+        combined = df['Date'] + ' ' + df['Time']
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+            try:
+                df['Timestamp'] = pd.to_datetime(combined, format=fmt,
+                                                 cache=True)
+                break
+            except (ValueError, TypeError):
+                continue
+        else:
+            # 非標準日期格式（如 MM/DD/YYYY）退回逐值推斷
+            df['Timestamp'] = pd.to_datetime(combined)
         df = df.sort_values('Timestamp')
 
-        # 計算數據覆蓋率
-        time_diff = df['Timestamp'].diff()
-        expected_interval = pd.Timedelta(minutes=5)  # CGM 通常每5分鐘一筆
-
-        large_gaps = time_diff[time_diff > pd.Timedelta(minutes=30)]
-        if len(large_gaps) > 0:
-            print(f"⚠ 發現 {len(large_gaps)} 個超過30分鐘的數據間隔")
+        # 計算數據覆蓋率：直接在 int64 奈秒上做差分與比較，
+        # 不產生中間 Timedelta Series（CGM 通常每5分鐘一筆）
+        ts = df['Timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+        large_gap_count = int((np.diff(ts) > _LARGE_GAP_NS).sum())
+        if large_gap_count > 0:
+            print(f"⚠ 發現 {large_gap_count} 個超過30分鐘的數據間隔")
 
         # 計算數據可用率
-        total_duration = df['Timestamp'].iloc[-1] - df['Timestamp'].iloc[0]
-        expected_readings = total_duration / expected_interval
+        total_duration_ns = int(ts[-1] - ts[0])
+        expected_readings = total_duration_ns / _EXPECTED_INTERVAL_NS
         data_availability = len(df) / expected_readings * 100
 
         print(f"📊 數據統計：")
         print(f"  - 時間範圍：{df['Timestamp'].iloc[0]} 至 {df['Timestamp'].iloc[-1]}")
-        print(f"  - 總天數：{total_duration.days} 天")
+        print(f"  - 總天數：{total_duration_ns // (1440 * _MINUTE_NS)} 天")
         print(f"  - 數據可用率：{data_availability:.1f}%")
         print(f"  - 平均血糖：{df['Sensor Glucose (mg/dL)'].mean():.1f} mg/dL")
 
@@ -7,12 +7,26 @@ CGM 技能自我測試工具
 import os
 import sys
 import json
-import yaml
+import functools
 import importlib.util
+import py_compile
 from pathlib import Path
+
+try:
+    import orjson  # C 實作的 JSON 序列化，比標準庫快一個數量級
+except ImportError:
+    orjson = None
 from typing import Dict, List, Tuple
 
 
+@functools.lru_cache(maxsize=None)
+def _has_module(name: str) -> bool:
+    """模組是否可匯入；find_spec 每次都走訪 sys.path，結果快取起來"""
+    if name in sys.modules:
+        return True
+    return importlib.util.find_spec(name) is not None
+
+
 class SkillTester:
     """技能測試器"""
 
@@ -62,6 +76,24 @@ class SkillTester:
 
         return len(self.test_results["failed"]) == 0
 
+    def _enumerate_files(self) -> set:
+        """一次列舉相關目錄，後續存在性檢查用 O(1) 集合查找
+
+        逐檔 Path.exists() 每次都是一個 stat 系統呼叫；
+        單趟 scandir 把同目錄的多次檢查攤平成一次列舉。
+        """
+        existing = set()
+        for rel_dir in ("", "scripts", "knowledge", "examples"):
+            dir_path = self.skill_root / rel_dir if rel_dir else self.skill_root
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        existing.add(f"{rel_dir}/{entry.name}" if rel_dir
+                                     else entry.name)
+            except FileNotFoundError:
+                continue
+        return existing
+
     def test_file_structure(self) -> Tuple[bool, str]:
         """測試檔案結構"""
         required_files = [
@@ -82,11 +114,9 @@ class SkillTester:
             "examples/sample_cgm_data.csv"
         ]
 
-        missing_files = []
-        for file_path in required_files:
-            full_path = self.skill_root / file_path
-            if not full_path.exists():
-                missing_files.append(file_path)
+        existing = self._enumerate_files()
+        missing_files = [file_path for file_path in required_files
+                         if file_path not in existing]
 
         if missing_files:
             return False, f"缺少檔案：{', '.join(missing_files)}"
@@ -103,11 +133,8 @@ class SkillTester:
             "openai"
         ]
 
-        missing_modules = []
-        for module in required_modules:
-            spec = importlib.util.find_spec(module)
-            if spec is None:
-                missing_modules.append(module)
+        missing_modules = [module for module in required_modules
+                           if not _has_module(module)]
 
         if missing_modules:
             self.test_results["warnings"].append(
@@ -121,12 +148,18 @@ class SkillTester:
     def test_scripts(self) -> Tuple[bool, str]:
         """測試腳本可執行性"""
         scripts_dir = self.skill_root / "scripts"
-        python_scripts = list(scripts_dir.glob("*.py"))
 
+        # 單趟 scandir 同時拿到檔名與權限位元，
+        # 省掉逐檔 os.access 各一次 faccessat 系統呼叫
+        python_scripts = []
         non_executable = []
-        for script in python_scripts:
-            if not os.access(script, os.X_OK):
-                non_executable.append(script.name)
+        with os.scandir(scripts_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.py'):
+                    continue
+                python_scripts.append(scripts_dir / entry.name)
+                if not (entry.stat().st_mode & 0o111):
+                    non_executable.append(entry.name)
 
         if non_executable:
             self.test_results["warnings"].append(
@@ -135,14 +168,14 @@ class SkillTester:
             )
             return False, f"{len(non_executable)} 個腳本沒有執行權限"
 
-        # 測試腳本語法
+        # 測試腳本語法：py_compile 會寫入並重用 __pycache__ 位元組碼，
+        # 未變動的腳本直接跳過重新剖析（compile() 每次都重讀重剖析）
         syntax_errors = []
         for script in python_scripts:
             try:
-                with open(script, 'r', encoding='utf-8') as f:
-                    compile(f.read(), script.name, 'exec')
-            except SyntaxError as e:
-                syntax_errors.append(f"{script.name}: {e}")
+                py_compile.compile(str(script), doraise=True)
+            except py_compile.PyCompileError as e:
+                syntax_errors.append(f"{script.name}: {e.msg}")
 
         if syntax_errors:
             return False, f"語法錯誤：{'; '.join(syntax_errors)}"
@@ -151,11 +184,17 @@ class SkillTester:
 
     def test_config(self) -> Tuple[bool, str]:
         """測試配置檔案"""
+        # yaml 只有這個測試用得到，延後匯入讓其他路徑不付載入成本
+        import yaml
+
+        # libyaml 的 C parser 比純 Python parser 快約 3–10 倍；繫結不存在時退回
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
         config_file = self.skill_root / "config.yaml"
 
         try:
             with open(config_file, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=loader)
 
             # 檢查必要的配置項
             required_keys = ["defaults", "ai_models", "output", "data_processing"]
@@ -185,19 +224,27 @@ class SkillTester:
         if not knowledge_dir.exists():
             return False, "知識庫目錄不存在"
 
-        # 統計知識檔案
-        md_files = list(knowledge_dir.rglob("*.md"))
-
-        if len(md_files) < 2:
-            return False, f"知識庫檔案不足（找到 {len(md_files)} 個）"
-
-        # 檢查檔案大小
-        total_size = sum(f.stat().st_size for f in md_files)
+        # 統計知識檔案：單趟 scandir 遞迴同時取得檔名與大小
+        # （rglob 已 stat 過一次，逐檔再 stat 會加倍系統呼叫）
+        md_count = 0
+        total_size = 0
+        stack = [str(knowledge_dir)]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.md'):
+                        md_count += 1
+                        total_size += entry.stat().st_size
+
+        if md_count < 2:
+            return False, f"知識庫檔案不足（找到 {md_count} 個）"
 
         if total_size < 1000:  # 至少 1KB
             return False, "知識庫內容太少"
 
-        return True, f"知識庫包含 {len(md_files)} 個檔案，總大小 {total_size/1024:.1f}KB"
+        return True, f"知識庫包含 {md_count} 個檔案，總大小 {total_size/1024:.1f}KB"
 
     def test_examples(self) -> Tuple[bool, str]:
         """測試範例數據"""
@@ -208,21 +255,35 @@ class SkillTester:
             return False, "範例數據檔案不存在"
 
         try:
-            # 嘗試讀取範例數據
+            # 檢查欄位只需要前幾列：限定 usecols/nrows 讓讀取量
+            # 與檔案大小脫鉤，大型範例檔也只讀開頭
             import pandas as pd
-            df = pd.read_csv(sample_file)
-
-            # 檢查必要欄位
             required_columns = ["Date", "Time", "Sensor Glucose (mg/dL)"]
-            missing_columns = [col for col in required_columns if col not in df.columns]
+            head = pd.read_csv(sample_file,
+                               usecols=lambda c: c in required_columns,
+                               nrows=16)
+
+            missing_columns = [col for col in required_columns
+                               if col not in head.columns]
 
             if missing_columns:
                 return False, f"範例數據缺少欄位：{', '.join(missing_columns)}"
 
-            if len(df) < 10:
-                return False, f"範例數據太少（只有 {len(df)} 筆）"
+            # 筆數直接數原始位元組的換行即可，不必整檔解析
+            row_count = 0
+            last_byte = b''
+            with open(sample_file, 'rb') as f:
+                for buf in iter(lambda: f.read(1 << 20), b''):
+                    row_count += buf.count(b'\n')
+                    last_byte = buf[-1:]
+            if last_byte not in (b'', b'\n'):
+                row_count += 1  # 最後一列沒有換行結尾
+            row_count -= 1  # 扣掉標題列
+
+            if row_count < 10:
+                return False, f"範例數據太少（只有 {row_count} 筆）"
 
-            return True, f"範例數據格式正確（{len(df)} 筆記錄）"
+            return True, f"範例數據格式正確（{row_count} 筆記錄）"
 
         except Exception as e:
             return False, f"無法讀取範例數據：{str(e)}"
@@ -247,12 +308,14 @@ class SkillTester:
                 if not part.isdigit():
                     return False, f"版本號必須是數字：{version}"
 
-            # 檢查 skill.md 中的版本
+            # 檢查 skill.md 中的版本：逐行掃描、找到即停，
+            # 不必把整份文件讀進記憶體（版本宣告都在檔頭附近）
+            target = f"version: {version}"
             skill_file = self.skill_root / "skill.md"
             with open(skill_file, 'r', encoding='utf-8') as f:
-                skill_content = f.read()
+                version_found = any(target in line for line in f)
 
-            if f"version: {version}" not in skill_content:
+            if not version_found:
                 self.test_results["warnings"].append(
                     f"skill.md 中的版本號與 VERSION 檔案不符"
                 )
@@ -295,9 +358,16 @@ class SkillTester:
                            if total_tests > 0 else 0
         }
 
+        # 先寫暫存檔再 os.replace，避免中途失敗留下半份報告
         report_file = self.skill_root / "test_report.json"
-        with open(report_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        tmp_file = report_file.with_suffix('.json.tmp')
+        if orjson is not None:
+            with open(tmp_file, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, report_file)
 
         print(f"\n📄 測試報告已儲存至：{report_file}")
 
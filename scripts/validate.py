@@ -4,20 +4,47 @@ CGM 數據驗證工具
 檢查輸入檔案格式並提供修復建議
 """
 
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+
+import codecs
 import sys
 import os
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
 import json
 
+# charset_normalizer 可精準判斷罕見編碼；未安裝時以 BOM/解碼探測退回
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+# pandas/numpy 匯入本身就要約 300 ms 的檔案 I/O 與 bytecode 執行，
+# --help 或參數錯誤等提前結束的路徑不該付這筆成本，延後到真正驗證時才載入
+pd = None
+np = None
+
+
+def _lazy_imports():
+    """首次驗證時才載入 pandas/numpy"""
+    global pd, np
+    if pd is None:
+        import pandas
+        import numpy
+        pd = pandas
+        np = numpy
+
 class CGMValidator:
     """CGM 數據驗證器"""
 
     def __init__(self, file_path: str):
         """初始化驗證器"""
         self.file_path = file_path
+        self._date_col = None
+        self._time_col = None
+        self._timestamps = None
+        self._glucose_col = None
+        self._glucose_numeric = None   # (欄位名, to_numeric 結果) 快取
         self.validation_results = {
             "is_valid": True,
             "errors": [],
@@ -29,6 +56,7 @@ class CGMValidator:
     def validate(self) -> Dict:
         """執行完整驗證"""
         print(f"開始驗證檔案：{self.file_path}")
+        _lazy_imports()
 
         # 檢查檔案存在
         if not self._check_file_exists():
@@ -39,6 +67,11 @@ class CGMValidator:
         if df is None:
             return self.validation_results
 
+        # 先一次掃描欄名、解析時間戳，後續檢查直接重用，
+        # 不再各自重掃欄位、重跑整趟 O(N) 的字串拼接與日期解析
+        self._detect_columns(df)
+        self._parse_timestamps(df)
+
         # 執行各項驗證
         self._check_required_columns(df)
         self._check_data_types(df)
@@ -51,6 +84,49 @@ class CGMValidator:
 
         return self.validation_results
 
+    def _detect_columns(self, df: pd.DataFrame):
+        """一次掃描欄名找出日期/時間/血糖欄位，各檢查改讀屬性"""
+        for col in df.columns:
+            lowered = col.lower()
+            if 'date' in lowered:
+                self._date_col = col
+            if 'time' in lowered:
+                self._time_col = col
+
+        # 血糖欄位：先比對標準名稱，再退回子字串比對
+        if 'Sensor Glucose (mg/dL)' in df.columns:
+            self._glucose_col = 'Sensor Glucose (mg/dL)'
+        elif 'Glucose' in df.columns:
+            self._glucose_col = 'Glucose'
+        else:
+            self._glucose_col = next(
+                (col for col in df.columns
+                 if 'glucose' in col.lower() or 'bg' in col.lower()), None)
+
+    def _parse_timestamps(self, df: pd.DataFrame):
+        """解析時間戳（整個驗證流程只做一次）"""
+        if not (self._date_col and self._time_col):
+            return
+
+        try:
+            combined = (df[self._date_col].astype(str) + ' ' +
+                        df[self._time_col].astype(str))
+        except Exception:
+            return
+
+        # 標準格式走向量化 C 解析器；非標準格式才退回逐值推斷
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+            try:
+                self._timestamps = pd.to_datetime(combined, format=fmt,
+                                                  cache=True)
+                return
+            except (ValueError, TypeError):
+                continue
+        try:
+            self._timestamps = pd.to_datetime(combined)
+        except Exception:
+            self._timestamps = None
+
     def _check_file_exists(self) -> bool:
         """檢查檔案是否存在"""
         if not os.path.exists(self.file_path):
@@ -70,24 +146,51 @@ class CGMValidator:
 
         return True
 
+    def _detect_encoding(self) -> str:
+        """以 64KB 檔頭偵測編碼——逐一用 read_csv 試編碼會把整個檔案
+        解析到出錯為止，偵測一次後只需讀檔一遍"""
+        with open(self.file_path, 'rb') as f:
+            head = f.read(65536)
+
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+
+        if charset_normalizer is not None:
+            best = charset_normalizer.from_bytes(head).best()
+            if best is not None:
+                return best.encoding
+
+        # 64KB 截斷點可能落在多位元組字元中間，嚴格 decode 會誤判；
+        # incremental decoder 以 final=False 容忍被截斷的結尾字元。
+        # latin1 永遠解得開，放最後作為保底
+        truncated = len(head) == 65536
+        for encoding in ('utf-8', 'big5', 'cp1252', 'latin1'):
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(
+                    head, final=not truncated)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return 'latin1'
+
+    def _read_csv(self, encoding: str) -> pd.DataFrame:
+        """讀取 CSV：pyarrow 引擎平行解析；不可用或不支援該編碼時退回 C 引擎"""
+        try:
+            return pd.read_csv(self.file_path, encoding=encoding,
+                               engine='pyarrow')
+        except (ImportError, ValueError, TypeError):
+            return pd.read_csv(self.file_path, encoding=encoding,
+                               engine='c', low_memory=False)
+
     def _load_data(self) -> Optional[pd.DataFrame]:
         """載入數據"""
         try:
-            # 嘗試不同的編碼
-            encodings = ['utf-8', 'latin1', 'cp1252', 'big5']
-            df = None
-
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(self.file_path, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-
-            if df is None:
-                self.validation_results["is_valid"] = False
-                self.validation_results["errors"].append("無法讀取檔案，請檢查檔案編碼")
-                return None
+            encoding = self._detect_encoding()
+            try:
+                df = self._read_csv(encoding)
+            except UnicodeDecodeError:
+                # 檔頭探測偶爾會被截斷的多位元組字元誤導，保底重讀一次
+                df = self._read_csv('latin1')
 
             if len(df) == 0:
                 self.validation_results["is_valid"] = False
@@ -110,18 +213,17 @@ class CGMValidator:
                        'BG', '血糖', 'Glucose Value (mg/dL)', 'Historic Glucose mg/dL']
         }
 
+        # set 一次建好做 O(1) 查找；逐別名掃 df.columns 在寬檔上是
+        # O(鍵 × 別名 × 欄位)。別名順序保持優先序不變
+        col_set = set(df.columns)
         found_columns = {}
         missing_columns = []
 
         for key, possible_names in required_columns.items():
-            found = False
-            for name in possible_names:
-                if name in df.columns:
-                    found_columns[key] = name
-                    found = True
-                    break
-
-            if not found:
+            name = next((n for n in possible_names if n in col_set), None)
+            if name is not None:
+                found_columns[key] = name
+            else:
                 missing_columns.append(key)
 
         if missing_columns:
@@ -136,60 +238,44 @@ class CGMValidator:
 
     def _check_data_types(self, df: pd.DataFrame):
         """檢查數據類型"""
-        if 'Sensor Glucose (mg/dL)' in df.columns:
-            glucose_col = 'Sensor Glucose (mg/dL)'
-        elif 'Glucose' in df.columns:
-            glucose_col = 'Glucose'
-        else:
+        glucose_col = self._glucose_col
+        if glucose_col is None:
             return
 
-        # 檢查血糖值是否為數字
-        non_numeric = df[~df[glucose_col].apply(lambda x: str(x).replace('.', '').replace('-', '').isdigit())]
-        if len(non_numeric) > 0:
+        # 檢查血糖值是否為數字：to_numeric 的 C 解析器一次掃完整欄，
+        # 取代逐列 apply + 每格三次字串配置；結果快取給後續範圍檢查重用
+        numeric = pd.to_numeric(df[glucose_col], errors='coerce')
+        self._glucose_numeric = (glucose_col, numeric)
+
+        non_numeric_count = int((numeric.isna() & df[glucose_col].notna()).sum())
+        if non_numeric_count > 0:
             self.validation_results["warnings"].append(
-                f"發現 {len(non_numeric)} 筆非數字血糖值，將被忽略"
+                f"發現 {non_numeric_count} 筆非數字血糖值，將被忽略"
             )
 
     def _check_date_time_format(self, df: pd.DataFrame):
         """檢查日期時間格式"""
-        date_col = None
-        time_col = None
-
-        # 找出日期和時間欄位
-        for col in df.columns:
-            if 'date' in col.lower():
-                date_col = col
-            if 'time' in col.lower():
-                time_col = col
-
-        if date_col and time_col:
-            # 嘗試解析日期時間
-            try:
-                df['Timestamp'] = pd.to_datetime(df[date_col] + ' ' + df[time_col])
-
-                # 檢查時間順序
-                if not df['Timestamp'].is_monotonic_increasing:
-                    self.validation_results["warnings"].append("數據時間順序不連續，將自動排序")
-
-            except:
+        if self._date_col and self._time_col:
+            if self._timestamps is None:
                 self.validation_results["errors"].append("無法解析日期時間格式")
                 self.validation_results["suggestions"].append(
                     "請確保日期格式為 YYYY-MM-DD，時間格式為 HH:MM:SS"
                 )
+            # 檢查時間順序
+            elif not self._timestamps.is_monotonic_increasing:
+                self.validation_results["warnings"].append("數據時間順序不連續，將自動排序")
 
     def _check_glucose_values(self, df: pd.DataFrame):
         """檢查血糖值範圍"""
-        glucose_col = None
-        for col in df.columns:
-            if 'glucose' in col.lower() or 'bg' in col.lower():
-                glucose_col = col
-                break
-
+        glucose_col = self._glucose_col
         if not glucose_col:
             return
 
-        # 轉換為數值
-        df[glucose_col] = pd.to_numeric(df[glucose_col], errors='coerce')
+        # 轉換為數值（型別檢查已算過的欄位直接重用）
+        if self._glucose_numeric and self._glucose_numeric[0] == glucose_col:
+            df[glucose_col] = self._glucose_numeric[1]
+        else:
+            df[glucose_col] = pd.to_numeric(df[glucose_col], errors='coerce')
 
         # 檢查範圍
         valid_range = (20, 600)  # mg/dL
@@ -215,10 +301,11 @@ class CGMValidator:
         """檢查數據完整性"""
         total_rows = len(df)
 
-        # 檢查缺失值
+        # 檢查缺失值：一次 df.isna().sum() 算出整個 Series 的缺失數，
+        # 不再逐欄各跑一趟縮減
         missing_stats = {}
-        for col in df.columns:
-            missing_count = df[col].isna().sum()
+        na_counts = df.isna().sum()
+        for col, missing_count in na_counts.items():
             if missing_count > 0:
                 missing_percentage = (missing_count / total_rows) * 100
                 missing_stats[col] = {
@@ -237,41 +324,33 @@ class CGMValidator:
     def _check_data_continuity(self, df: pd.DataFrame):
         """檢查數據連續性"""
         try:
-            # 創建時間戳
-            date_col = time_col = None
-            for col in df.columns:
-                if 'date' in col.lower():
-                    date_col = col
-                if 'time' in col.lower():
-                    time_col = col
-
-            if date_col and time_col:
-                df['Timestamp'] = pd.to_datetime(df[date_col] + ' ' + df[time_col])
-                df = df.sort_values('Timestamp')
-
-                # 計算時間間隔
-                time_diff = df['Timestamp'].diff()
-
-                # 預期間隔（通常 CGM 每 5 分鐘一筆）
-                expected_interval = timedelta(minutes=5)
-
-                # 找出大間隔
-                large_gaps = time_diff[time_diff > timedelta(minutes=30)]
-
-                if len(large_gaps) > 0:
+            # 重用 validate() 開頭解析好的時間戳，
+            # 差分與比較直接在 int64 奈秒上進行，不經過 Timedelta 裝箱
+            if self._timestamps is not None:
+                minute_ns = 60 * 1_000_000_000
+                ts = self._timestamps.to_numpy(dtype='datetime64[ns]').view('i8')
+                # CGM 匯出幾乎都已按時間排序，已排序就省掉 O(N log N) 的排序
+                if not self._timestamps.is_monotonic_increasing:
+                    ts = np.sort(ts)
+
+                # 找出大間隔（預期間隔：CGM 通常每 5 分鐘一筆）
+                large_gap_count = int(
+                    np.count_nonzero(np.diff(ts) > 30 * minute_ns))
+
+                if large_gap_count > 0:
                     self.validation_results["warnings"].append(
-                        f"發現 {len(large_gaps)} 個超過 30 分鐘的數據間隔"
+                        f"發現 {large_gap_count} 個超過 30 分鐘的數據間隔"
                     )
 
                 # 計算覆蓋率
                 if len(df) > 1:
-                    total_duration = df['Timestamp'].iloc[-1] - df['Timestamp'].iloc[0]
-                    expected_readings = total_duration / expected_interval
+                    total_duration_ns = int(ts[-1] - ts[0])
+                    expected_readings = total_duration_ns / (5 * minute_ns)
                     coverage = (len(df) / expected_readings) * 100
 
                     self.validation_results["statistics"]["coverage"] = {
                         "percentage": float(min(coverage, 100)),
-                        "duration_days": float(total_duration.days),
+                        "duration_days": float(total_duration_ns // (1440 * minute_ns)),
                         "total_readings": len(df)
                     }
 